@@ -11,10 +11,14 @@ import sqlite3
 import openpyxl
 import re
 import datetime
+import threading
+from urllib.request import pathname2url
+import pipeline_profiler as prof
 
 DATABASE_NAME = "phone_reviews_database.db"
 ITEMS_EXCEL = "items.xlsx"
 REVIEWS_EXCEL = "reviews.xlsx"
+thread_connections = threading.local()
 
 
 def file_exists(filename):
@@ -45,7 +49,10 @@ def run_database_query(query, params=None, single_entry=True):
         Returns:
             Array: The retrieved data of the executed query, emtpy array if query doesn't return values.
     """
-    connection = sqlite3.connect(DATABASE_NAME)
+    connection = getattr(thread_connections, 'connection', None)
+    owns_connection = connection is None
+    if owns_connection:
+        connection = connect_to_database()
     cursor = connection.cursor()
     results = []
     if params is None:
@@ -57,12 +64,67 @@ def run_database_query(query, params=None, single_entry=True):
     else:
         results = cursor.execute(query, params).fetchall()
     connection.commit()
-    connection.close()
+    if owns_connection:
+        connection.close()
     return results
 
 
+def connect_to_database(read_only=False):
+    """ Opens a new connection to the database.
+
+        Args:
+            read_only (bool, optional): True opens the database in read-only mode. Defaults to False.
+
+        Returns:
+            `sqlite3.Connection`: The opened connection.
+    """
+    if read_only:
+        return sqlite3.connect("file:{0}?mode=ro".format(pathname2url(DATABASE_NAME)), uri=True)
+    return sqlite3.connect(DATABASE_NAME)
+
+
+def open_thread_connection(read_only=True):
+    """ Opens a connection which is reused by every query run on the current thread until it is closed, so each
+    thread of a pool works on its own connection.
+
+        Args:
+            read_only (bool, optional): True opens the database in read-only mode. Defaults to True.
+
+        Returns:
+            `sqlite3.Connection`: The connection of the current thread.
+    """
+    if getattr(thread_connections, 'connection', None) is None:
+        thread_connections.connection = connect_to_database(read_only)
+    return thread_connections.connection
+
+
+def close_thread_connection():
+    """ Closes the connection of the current thread if one was opened. """
+    connection = getattr(thread_connections, 'connection', None)
+    if connection is not None:
+        connection.close()
+        thread_connections.connection = None
+
+
+def get_database_signature():
+    """ Gets a signature of the database file which changes whenever the database is modified or re-created.
+
+        Returns:
+            tuple: The inode, size, modification time and header change counter of the database file.
+    """
+    stat = os.stat(DATABASE_NAME)
+    with open(DATABASE_NAME, 'rb') as database:
+        database.seek(24)
+        change_counter = int.from_bytes(database.read(4), 'big')
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns, change_counter
+
+
 def create_database():
-    """ Creates the database, tables and inserts the data into those tables. """
+    """ Creates the database, tables and inserts the data into those tables, then builds the review sample used by
+    approximate analytics and re-creates the year partitions if the database was partitioned. """
+    import review_sample  # imported here as review_sample and partitioned_reviews import this module
+    import partitioned_reviews
+    partitioned = len(partitioned_reviews.get_partition_years()) > 0
     print("Creating database...\n")
     run_database_query("drop table if exists items")
     run_database_query("drop table if exists reviews")
@@ -70,6 +132,9 @@ def create_database():
     create_reviews_table()
     seed_database(ITEMS_EXCEL, 'insert into items values(?,?,?,?,?,?,?,?,?)')
     seed_database(REVIEWS_EXCEL, 'insert into reviews values(NULL,?,?,?,?,?,?,?,?)')
+    review_sample.build_review_sample()
+    if partitioned:
+        partitioned_reviews.create_partitions()
 
 
 def create_items_table():
@@ -91,10 +156,14 @@ def create_items_table():
         );""")
 
 
-def create_reviews_table():
-    """ Creates the reviews table for the database """
+def create_reviews_table(table_name="reviews"):
+    """ Creates the reviews table for the database
+
+        Args:
+            table_name (string, optional): The name of the table. Defaults to reviews.
+    """
     run_database_query("""
-        create table reviews(
+        create table {0}(
             review_id integer,
             asin char(10) not null,
             name varchar(255) not null,
@@ -108,9 +177,10 @@ def create_reviews_table():
             constraint reviews_fk foreign key (asin) references items(asin),
             constraint valid_review check (rating between 0 and 5 and date(review_date) is not null and 
                 verified in ('True', 'False') and helpful_vote >= 0)
-        );""")
+        );""".format(table_name))
 
 
+@prof.profiled()
 def seed_database(excel_file, query):
     """ Seeds the database with the data provided in the excel files.
 
@@ -118,18 +188,21 @@ def seed_database(excel_file, query):
             excel_file (string): The name of the excel file to seed from.
             query (string): The query to be used to insert data.
      """
-    data = openpyxl.load_workbook(excel_file)
+    with prof.stage("workbook parsing"):
+        data = openpyxl.load_workbook(excel_file)
     print("Workbook '{0}' contains {1} rows of data".format(excel_file, data.active.max_row - 1))
     records_to_seed = prompt_for_number_of_records(data.active.max_row - 1)
     print("\tSeeding data from Workbook '{0}'...".format(excel_file))
     data_to_insert = []
-    for row in data.active.iter_rows(min_row=2, max_row=records_to_seed + 1):
-        record = []
-        for cell in row:
-            val = check_for_incorrect_formatting(data.active.cell(row=1, column=cell.column).value, cell.value)
-            record.append(val)
-        data_to_insert.append(tuple(record))
-    run_database_query(query, data_to_insert, False)
+    with prof.stage("cleaning", hot=True):
+        for row in data.active.iter_rows(min_row=2, max_row=records_to_seed + 1):
+            record = []
+            for cell in row:
+                val = check_for_incorrect_formatting(data.active.cell(row=1, column=cell.column).value, cell.value)
+                record.append(val)
+            data_to_insert.append(tuple(record))
+    with prof.stage("inserts"):
+        run_database_query(query, data_to_insert, False)
 
 
 def check_for_incorrect_formatting(heading, value):
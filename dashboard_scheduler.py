@@ -0,0 +1,67 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import created_reviews as cr
+import pipeline_profiler as prof
+
+MAX_CONCURRENT_QUERIES = 4
+
+
+def run_timed_task(task):
+    """ Runs a task on the current thread, every query of the task using one read-only connection which is closed
+    when the task finishes. A connection the thread already had open is used instead and left open.
+
+        Args:
+            task (callable): The function retrieving the data.
+
+        Returns:
+            `tuple`(variable type, float): The result of the task and the seconds it took to run.
+    """
+    start = time.perf_counter()
+    owns_connection = getattr(cr.thread_connections, 'connection', None) is None
+    cr.open_thread_connection(read_only=True)
+    try:
+        result = task()
+    finally:
+        if owns_connection:
+            cr.close_thread_connection()
+    return result, time.perf_counter() - start
+
+
+def run_dashboard_queries(tasks, max_workers=MAX_CONCURRENT_QUERIES):
+    """ Runs independent data retrieval tasks concurrently on a thread pool. Each task runs on its own read-only
+    connection so the queries don't wait on each other. While profiling mode is turned on the tasks run one after
+    another on the calling thread instead, as memory peaks are only measured for stages on the main thread.
+
+        Args:
+            tasks (Dictionary (`str`, callable)): Key = task name, value = function retrieving the data.
+            max_workers (int, optional): The maximum number of tasks run at once, 0 runs them one after another on the
+                calling thread. Defaults to MAX_CONCURRENT_QUERIES.
+
+        Returns:
+            `tuple`(Dictionary, Dictionary): The results and the seconds taken of each task, keyed by task name.
+    """
+    results = {}
+    timings = {}
+    if max_workers <= 0 or prof.is_enabled():
+        for name, task in tasks.items():
+            results[name], timings[name] = run_timed_task(task)
+        return results, timings
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dashboard") as executor:
+        futures = {name: executor.submit(run_timed_task, task) for name, task in tasks.items()}
+        for name, future in futures.items():
+            results[name], timings[name] = future.result()
+    return results, timings
+
+
+def print_task_timings(timings, total_time=None):
+    """ Prints how long each task took to run.
+
+        Args:
+            timings (Dictionary (`str`, float)): Key = task name, value = seconds taken.
+            total_time (float, optional): The seconds taken to run every task.
+    """
+    print("Dashboard query timings:")
+    for name, seconds in sorted(timings.items(), key=lambda x: x[1], reverse=True):
+        print("\t{0} - {1:.3f}s".format(name, seconds))
+    if total_time is not None:
+        print("\tTotal - {0:.3f}s (sum of tasks {1:.3f}s)".format(total_time, sum(timings.values())))
@@ -1,4 +1,6 @@
 import created_reviews as cr
+import pipeline_profiler as prof
+import review_sample as rs
 import openpyxl
 import matplotlib.pyplot as plt
 import numpy as np
@@ -10,6 +12,7 @@ REVIEW_HEADINGS = ["Brand", "Product Title", "Year", "Number of Reviews"]
 CUSTOMER_HEADINGS = ["Brand", "Percentage of Verified Customers", "Percentage of Each Customer Group"]
 
 
+@prof.profiled("openpyxl write")
 def create_new_workbook():
     """ Creates the comparison workbook, sets sheet headings and writes the data to the appropriate sheets. """
     print("Creating Workbook '{0}'".format(COMPARISON_EXCEL_WORKBOOK))
@@ -38,6 +41,7 @@ def insert_worksheet_headings(worksheet, headings):
         worksheet.cell(row=1, column=col, value="{0}".format(headings[col - 1]))
 
 
+@prof.profiled("openpyxl write")
 def write_data_to_workbook(data, sheet_name):
     """ Writes the data retrieved from the database into the correct worksheets
 
@@ -60,6 +64,7 @@ def write_data_to_workbook(data, sheet_name):
         print("Permission to save the file was denied. Make sure that the file is closed")
 
 
+@prof.profiled("report query")
 def get_review_yearly_data():
     """ Gets the number of reviews per year for each product, grouping by product title and year
 
@@ -72,13 +77,25 @@ def get_review_yearly_data():
     return records
 
 
-def get_verified_customer_data():
+@prof.profiled("report query")
+def get_verified_customer_data(approximate=False):
     """ Gets the brands, the percentage of users that have left a review that are verified and the percentage of those in
     relation to all verified users
 
+        Args:
+            approximate (bool, optional): True estimates the percentages from the review sample instead of querying
+                every review. Defaults to False.
+
         Returns:
-            Array: The records retrieved from the database.
+            Array: The records retrieved from the database. Approximate records are followed by the lower and upper
+                bounds of the 95% confidence interval of each percentage.
     """
+    if approximate:
+        records = []
+        for brand, share_of_verified, brand_verified in rs.get_approximate_verified_customer_data():
+            records.append((brand, share_of_verified[0], brand_verified[0], share_of_verified[1], share_of_verified[2],
+                            brand_verified[1], brand_verified[2]))
+        return records
     records = cr.run_database_query("""
         select i.brand, cast(count() as float) / (select count() from reviews where verified = 'True') * 100,
         cast(count() as float) / (select count() from reviews ir join items ii on ii.asin = ir.asin where ii.brand = i.brand) * 100
@@ -100,18 +117,29 @@ def get_workbook_info():
     return workbook_info
 
 
+@prof.profiled("matplotlib rendering")
 def plot_customer_data(query_data):
     labels = []
     verified_reviews = []
     overall_verified = []
+    verified_reviews_error = [[], []]
+    overall_verified_error = [[], []]
     width = 0.35
     for data in query_data:
         labels.append(data[0])
         overall_verified.append(data[1])
         verified_reviews.append(data[2])
+        if len(data) > 3:
+            overall_verified_error[0].append(data[1] - data[3])
+            overall_verified_error[1].append(data[4] - data[1])
+            verified_reviews_error[0].append(data[2] - data[5])
+            verified_reviews_error[1].append(data[6] - data[2])
+    approximate = len(overall_verified_error[0]) > 0
     bar_size = np.arange(len(labels))
-    bar1 = plt.bar(bar_size - width / 2, verified_reviews, width, label="Brands Verified User %")
-    bar2 = plt.bar(bar_size + width / 2, overall_verified, width, label="Brands Overall Verified User %")
+    bar1 = plt.bar(bar_size - width / 2, verified_reviews, width, label="Brands Verified User %",
+                   yerr=verified_reviews_error if approximate else None)
+    bar2 = plt.bar(bar_size + width / 2, overall_verified, width, label="Brands Overall Verified User %",
+                   yerr=overall_verified_error if approximate else None)
     plt.title("Percentage of Verified Users Grouped By Brand")
     plt.ylabel("Verified Users (%)")
     plt.xlabel("Brand Name")
@@ -155,7 +183,21 @@ if __name__ == '__main__':
     while not plot_selection:
         user_input = input("Do you want to view customer data graphically? (y/n): ").lower()
         if user_input == 'y':
-            plot_customer_data(get_verified_customer_data())
+            approximate_selection = None
+            while approximate_selection is None:
+                user_input = input("Do you want to estimate the data from the review sample? (y/n): ").lower()
+                if user_input in ('y', 'n'):
+                    approximate_selection = user_input == 'y'
+                else:
+                    print("Invalid selection")
+            customer_data = get_verified_customer_data(approximate_selection)
+            if approximate_selection:
+                print("Approximate verified customer percentages (95% confidence intervals):")
+                for record in customer_data:
+                    print("\t{0} - {1} of verified reviews, {2} of brand reviews".format(
+                        record[0], rs.format_estimate((record[1], record[3], record[4])),
+                        rs.format_estimate((record[2], record[5], record[6]))))
+            plot_customer_data(customer_data)
             plot_selection = True
         elif user_input == 'n':
             print("Exiting...")
@@ -3,16 +3,35 @@ import matplotlib.dates as plt_dates
 import numpy as np
 import datetime
 import re
+import sys
+import time
 import created_reviews as cr
+import dashboard_scheduler as ds
+import pipeline_profiler as prof
+import review_sample as rs
+import review_cache as rc
+import partitioned_reviews as pr
 
+PRICE_COMMENT_PATTERN = "(price|cost|[$]+)"
 
-def get_top_three_brands_total_reviews():
+
+@prof.profiled("report query")
+def get_top_three_brands_total_reviews(cached=False):
     """ Gets the top three brands total reviews
 
+        Args:
+            cached (bool, optional): True computes the report from the memory mapped review columns, exporting them
+                first if the database has changed. Defaults to False.
+
         Returns:
             Dictionary (`str`, `ndarray`): Key = brand name, value = [[dates][review_counts]]
      """
     top_three_brand_reviews = {}
+    if cached:
+        review_columns = rc.load_review_columns()
+        for brand in rc.get_top_n_brands(review_columns):
+            top_three_brand_reviews[brand] = rc.get_monthly_review_counts(review_columns, brand)
+        return top_three_brand_reviews
     top_three_brands_query = """
         select i.brand from items i join reviews r on r.asin = i.asin group by i.brand order by count() desc limit 3
     """
@@ -27,14 +46,28 @@ def get_top_three_brands_total_reviews():
     return top_three_brand_reviews
 
 
-def get_top_five_brands_average_rating_per_month_2017_2019():
+@prof.profiled("report query")
+def get_top_five_brands_average_rating_per_month_2017_2019(partitioned=False):
     """ Gets the top five brands average rating per month from 2017-2019 for the top five rated brands during that
     period.
 
+        Args:
+            partitioned (bool, optional): True reads only the 2017-2019 year partitions in parallel instead of
+                scanning the reviews table. Defaults to False.
+
         Returns:
             Dictionary(`string`, `ndarray`): Key = brand name, value = [[dates][avg_rating]]
     """
     top_five_brands_average_rating = {}
+    if partitioned:
+        brand_averages = pr.get_brand_average_ratings(2017, 2019)
+        brand_monthly_averages = {}
+        for brand, date, average in pr.get_brand_monthly_average_ratings(2017, 2019):
+            brand_monthly_averages.setdefault(brand, []).append((date, average))
+        for name in sorted(brand_averages, key=lambda x: brand_averages[x], reverse=True)[:5]:
+            top_five_brands_average_rating[name] = create_n_dimensional_array(2, brand_monthly_averages[name],
+                                                                              is_date=True)
+        return top_five_brands_average_rating
     get_brand_names_query = """
         select i.brand from items i join reviews r on r.asin = i.asin where strftime('%Y', r.review_date) between 
         '2017' and '2019' group by i.brand order by avg(r.rating) desc limit 5
@@ -50,6 +83,7 @@ def get_top_five_brands_average_rating_per_month_2017_2019():
     return top_five_brands_average_rating
 
 
+@prof.profiled("report query")
 def get_reviews_against_average_rating_for_product_titles():
     """ Gets the average rating and review count of each product title
 
@@ -65,6 +99,7 @@ def get_reviews_against_average_rating_for_product_titles():
     return reviews_against_average_rating
 
 
+@prof.profiled("report query")
 def get_review_body():
     """ Gets the date and body for each review that has been left.
 
@@ -78,6 +113,7 @@ def get_review_body():
     return review_body
 
 
+@prof.profiled("report query", hot=True)
 def pull_comments_related_to_price(review_body_data):
     """ Searches through the review bodys looking for words that could be related to the cost of a phone.
 
@@ -88,7 +124,7 @@ def pull_comments_related_to_price(review_body_data):
     for review in review_body_data:
         date = review[0]
         body = review[1]
-        search = re.search("(price|cost|[$]+)", body)
+        search = re.search(PRICE_COMMENT_PATTERN, body)
         if search:
             if date in review_body_yearly_count:
                 review_body_yearly_count[date] += 1
@@ -99,6 +135,36 @@ def pull_comments_related_to_price(review_body_data):
     return review_body_yearly_count
 
 
+def get_comments_related_to_price(approximate=False):
+    """ Gets the number of reviews per year with comments that could be related to the cost of a phone.
+
+        Args:
+            approximate (bool, optional): True estimates the yearly counts from the review sample instead of searching
+                every review. Defaults to False.
+
+        Returns:
+            `ndarray`: [[dates][review_counts]], approximate counts are followed by [low][high], the bounds of their
+                95% confidence intervals.
+    """
+    if approximate:
+        return get_approximate_comments_related_to_price()
+    return pull_comments_related_to_price(get_review_body())
+
+
+@prof.profiled("report query")
+def get_approximate_comments_related_to_price():
+    """ Estimates the number of reviews per year with comments that could be related to the cost of a phone from the
+    review sample.
+
+        Returns:
+            `ndarray`: [[dates][review_counts][low][high]], low and high bound the 95% confidence interval of each count.
+    """
+    yearly_counts = []
+    for year, estimate in rs.get_approximate_keyword_counts_per_year(PRICE_COMMENT_PATTERN).items():
+        yearly_counts.append(("01-{0}".format(str(year)[2:]),) + estimate)
+    return create_n_dimensional_array(4, yearly_counts, is_date=True)
+
+
 def convert_dictionary_to_tuple_array(dictionary):
     """ Converts a dictionary to an array of tuples.
 
@@ -113,6 +179,7 @@ def convert_dictionary_to_tuple_array(dictionary):
     return converted
 
 
+@prof.profiled("array building", hot=True)
 def create_n_dimensional_array(n, data, is_date=False):
     """ Creates an n-dimensional array.
 
@@ -154,6 +221,7 @@ def find_min_max_date(data):
     return min, max
 
 
+@prof.profiled("matplotlib rendering")
 def plot_time_series_data(plot, data, plot_title, x_label, y_label):
     """ Plots a set of time series data.
 
@@ -179,6 +247,7 @@ def plot_time_series_data(plot, data, plot_title, x_label, y_label):
     plot.legend(data.keys())
 
 
+@prof.profiled("matplotlib rendering")
 def generate_scatter_plot(plot, data, plot_title, x_label, y_label):
     """ Generates a scatter plot.
 
@@ -196,17 +265,20 @@ def generate_scatter_plot(plot, data, plot_title, x_label, y_label):
     plot.set_ylabel(y_label)
 
 
+@prof.profiled("matplotlib rendering")
 def plot_numerical_data(plot, data, plot_title, x_label, y_label):
     """ Plots a set of numerical data.
 
         Args:
             plot (`matplotlib.pyplot`): The plot to use for plotting the data.
-            data (`ndarray`): The data to be plotted.
+            data (`ndarray`): The data to be plotted, confidence interval bounds in data[2] and data[3] are shaded.
             plot_title (`str`): The title to be used for the plot.
             x_label (`str`): The label to be used for the x-axis.
             y_label (`str`): The label to be used for the y-axis.
     """
     plot.plot(data[0], data[1], 'o-')
+    if len(data) > 3:
+        plot.fill_between(data[0], data[2].astype(float), data[3].astype(float), alpha=0.3)
     plot.set_title(plot_title)
     plot.set_xlabel(x_label)
     plot.set_ylabel(y_label)
@@ -218,13 +290,32 @@ def plot_numerical_data(plot, data, plot_title, x_label, y_label):
 
 
 if __name__ == "__main__":
-    plot_time_series_data(plt.subplot(221), get_top_three_brands_total_reviews(), "Number of Reviews Per Month For the Top 3 Brands",
-                  "Time (Months)", "No. of Reviews")
-    plot_time_series_data(plt.subplot(222), get_top_five_brands_average_rating_per_month_2017_2019(),
+    """ Executed when the file is run. Passing '--partitioned' reads the year partitions where a report supports it,
+    '--approximate' estimates the price comment counts from the review sample and '--cached' reads the top three brands
+    from the memory mapped review columns. """
+    partitioned_mode = "--partitioned" in sys.argv[1:]
+    approximate_mode = "--approximate" in sys.argv[1:]
+    cached_mode = "--cached" in sys.argv[1:]
+    start_time = time.perf_counter()
+    dashboard_data, task_timings = ds.run_dashboard_queries({
+        "top_three_brands_total_reviews": lambda: get_top_three_brands_total_reviews(cached_mode),
+        "top_five_brands_average_rating": lambda: get_top_five_brands_average_rating_per_month_2017_2019(
+            partitioned_mode),
+        "reviews_against_average_rating": get_reviews_against_average_rating_for_product_titles,
+        "comments_related_to_price": lambda: get_comments_related_to_price(approximate_mode)
+    })
+    ds.print_task_timings(task_timings, time.perf_counter() - start_time)
+    if approximate_mode:
+        print("Approximate number of reviews per year relating to the cost of a phone (95% confidence intervals):")
+        for date, count, low, high in zip(*dashboard_data["comments_related_to_price"]):
+            print("\t{0} - {1}".format(date.year, rs.format_estimate((count, low, high))))
+    plot_time_series_data(plt.subplot(221), dashboard_data["top_three_brands_total_reviews"],
+                          "Number of Reviews Per Month For the Top 3 Brands", "Time (Months)", "No. of Reviews")
+    plot_time_series_data(plt.subplot(222), dashboard_data["top_five_brands_average_rating"],
                   "Top 5 Brands Average Monthly Rating 2017-2019", "Time (Months)", "Avg Rating")
-    generate_scatter_plot(plt.subplot(223), get_reviews_against_average_rating_for_product_titles(),
+    generate_scatter_plot(plt.subplot(223), dashboard_data["reviews_against_average_rating"],
                           "Phone Title's Average Rating vs No. of Reviews", "Average Rating", "No. of Reviews")
-    plot_numerical_data(plt.subplot(224), pull_comments_related_to_price(get_review_body()),
+    plot_numerical_data(plt.subplot(224), dashboard_data["comments_related_to_price"],
               "Number of Reviews Per Year Relating To The Cost Of A Phone", "Time (Years)", "No. of Reviews")
     plt.subplots_adjust(hspace=0.75)
     plt.show()
@@ -0,0 +1,249 @@
+import re
+import json
+import created_reviews as cr
+import dashboard_scheduler as ds
+
+PARTITION_PREFIX = "reviews_"
+VIEW_NAME = "reviews_partitioned"
+CACHE_TABLE = "partition_aggregate_cache"
+STATE_TABLE = "partition_state"
+TRIGGER_EVENTS = ["insert", "update", "delete"]
+AGGREGATES = {
+    # name: (query run against a single partition, number of leading key columns). Every other column must be a count
+    # or sum so the per-partition results can be merged by adding them together.
+    "brand_review_counts": ("""
+        select i.brand, count() from {0} r join items i on i.asin = r.asin group by i.brand
+    """, 1),
+    "title_review_counts": ("""
+        select i.brand, i.title, count() from {0} r join items i on i.asin = r.asin group by i.title
+    """, 2),
+    "brand_ratings": ("""
+        select i.brand, sum(r.rating), count() from {0} r join items i on i.asin = r.asin group by i.brand
+    """, 1),
+    "brand_monthly_ratings": ("""
+        select i.brand, strftime('%Y-%m', r.review_date) as date,
+        sum(r.rating), count() from {0} r join items i on i.asin = r.asin group by i.brand, date
+    """, 2)
+}
+
+
+def get_partition_name(year):
+    """ Gets the name of the table holding the reviews of a year.
+
+        Args:
+            year (int): The year of the partition.
+
+        Returns:
+            string: The name of the partition table.
+    """
+    return "{0}{1}".format(PARTITION_PREFIX, year)
+
+
+def get_partition_years():
+    """ Gets the years which have a partition table.
+
+        Returns:
+            Array (int): The partitioned years in ascending order.
+    """
+    tables = cr.get_database_info()
+    return sorted(int(table[0][-4:]) for table in tables if re.fullmatch(PARTITION_PREFIX + "[0-9]{4}", table[0]))
+
+
+def drop_partitions():
+    """ Drops the partition tables, the view unifying them, the aggregate cache and the triggers tracking changes. """
+    cr.run_database_query("drop view if exists {0}".format(VIEW_NAME))
+    for year in get_partition_years():
+        cr.run_database_query("drop table if exists {0}".format(get_partition_name(year)))
+    for event in TRIGGER_EVENTS:
+        cr.run_database_query("drop trigger if exists reviews_partition_{0}".format(event))
+    cr.run_database_query("drop table if exists {0}".format(CACHE_TABLE))
+    cr.run_database_query("drop table if exists {0}".format(STATE_TABLE))
+
+
+def create_partitions():
+    """ Splits the reviews table into one table per year, creates a view unifying them for ad-hoc queries and fills
+    the aggregate cache for every cold partition, so queries never have to write to the database. The reviews table is left untouched so the partitioned layout stays optional, at the cost of
+    storing every review twice. Triggers on the reviews table mark the partitions as out of date when it changes. """
+    print("Creating year partitions of the reviews table...")
+    drop_partitions()
+    years = [int(year[0]) for year in cr.run_database_query(
+        "select distinct strftime('%Y', review_date) as year from reviews order by year")]
+    for year in years:
+        partition = get_partition_name(year)
+        cr.create_reviews_table(partition)
+        cr.run_database_query("insert into {0} select * from reviews where strftime('%Y', review_date) = ?"
+                              .format(partition), (str(year),))
+        cr.run_database_query("create index {0}_asin on {0}(asin)".format(partition))
+        print("\tPartition '{0}' contains {1} records".format(
+            partition, cr.run_database_query("select count() from {0}".format(partition))[0][0]))
+    if years:
+        cr.run_database_query("create view {0} as {1}".format(
+            VIEW_NAME, " union all ".join("select * from {0}".format(get_partition_name(year)) for year in years)))
+    cr.run_database_query("""
+        create table {0}(
+            aggregate varchar(30) not null,
+            year integer not null,
+            result text not null,
+            constraint {0}_pk primary key (aggregate, year)
+        );""".format(CACHE_TABLE))
+    for year in years:
+        if is_cold_partition(year, years):
+            for aggregate in AGGREGATES:
+                rows = cr.run_database_query(AGGREGATES[aggregate][0].format(get_partition_name(year)))
+                cr.run_database_query("insert into {0} values(?, ?, ?)".format(CACHE_TABLE),
+                                      (aggregate, year, json.dumps(rows)))
+    cr.run_database_query("create table {0}(stale boolean not null)".format(STATE_TABLE))
+    cr.run_database_query("insert into {0} values(0)".format(STATE_TABLE))
+    for event in TRIGGER_EVENTS:
+        cr.run_database_query("""
+            create trigger reviews_partition_{0} after {0} on reviews
+            begin
+                update {1} set stale = 1;
+            end;""".format(event, STATE_TABLE))
+
+
+def partitions_are_current():
+    """ Checks to see if the partitions still hold the same reviews as the reviews table. The partitions are out of
+    date if a review was changed since they were created, or if the reviews table was re-created, which drops its
+    triggers.
+
+        Returns:
+            bool: True if the partitions can be queried, otherwise false.
+    """
+    objects = [name for (name,) in cr.run_database_query("select name from sqlite_master")]
+    if STATE_TABLE not in objects or any("reviews_partition_{0}".format(event) not in objects
+                                         for event in TRIGGER_EVENTS):
+        return False
+    return cr.run_database_query("select stale from {0}".format(STATE_TABLE))[0][0] == 0
+
+
+def prune_partitions(start_year=None, end_year=None):
+    """ Gets the partitions which can contain reviews within a range of years.
+
+        Args:
+            start_year (int, optional): The first year of the range.
+            end_year (int, optional): The last year of the range.
+
+        Returns:
+            Array (int): The years of the partitions to be queried.
+    """
+    return [year for year in get_partition_years()
+            if (start_year is None or year >= start_year) and (end_year is None or year <= end_year)]
+
+
+def is_cold_partition(year, partition_years):
+    """ Checks to see if a partition is cold. Every year before the newest partitioned year is treated as immutable, so
+    its aggregates can be cached until the partitions are re-created.
+
+        Args:
+            year (int): The year of the partition.
+            partition_years (Array (int)): Every partitioned year in ascending order.
+
+        Returns:
+            bool: True if the partition is cold, otherwise false.
+    """
+    return len(partition_years) > 0 and year < partition_years[-1]
+
+
+def get_cached_aggregates(aggregate, years):
+    """ Gets the cached results of an aggregate for cold partitions.
+
+        Args:
+            aggregate (string): The name of the aggregate.
+            years (Array (int)): The years to look up.
+
+        Returns:
+            Dictionary (int, Array): Key = year, value = the cached rows.
+    """
+    if not years:
+        return {}
+    cached = cr.run_database_query("select year, result from {0} where aggregate = ? and year in ({1})".format(
+        CACHE_TABLE, ", ".join("?" * len(years))), tuple([aggregate] + years))
+    return {year: [tuple(row) for row in json.loads(result)] for year, result in cached}
+
+
+def merge_aggregates(partition_results, key_columns):
+    """ Merges per-partition aggregate rows by adding together the values of rows with the same key.
+
+        Args:
+            partition_results (Array (Array (tuple))): The rows retrieved from each partition.
+            key_columns (int): The number of leading columns making up the key of a row.
+
+        Returns:
+            Array (tuple): The merged rows ordered by key.
+    """
+    merged = {}
+    for rows in partition_results:
+        for row in rows:
+            key = tuple(row[:key_columns])
+            if key in merged:
+                merged[key] = [total + value for total, value in zip(merged[key], row[key_columns:])]
+            else:
+                merged[key] = list(row[key_columns:])
+    return [key + tuple(values) for key, values in sorted(merged.items(), key=lambda x: x[0])]
+
+
+def run_partitioned_aggregate(aggregate, start_year=None, end_year=None, max_workers=ds.MAX_CONCURRENT_QUERIES):
+    """ Runs an aggregate over the partitions within a range of years. Cold partitions are answered from the cache
+    filled by create_partitions, the remaining partitions are queried in parallel and the results merged. Nothing is
+    written to the database, so the aggregate can run on a read-only connection.
+
+        Args:
+            aggregate (string): The name of the aggregate, one of AGGREGATES.
+            start_year (int, optional): The first year to include.
+            end_year (int, optional): The last year to include.
+            max_workers (int, optional): The maximum number of partitions queried at once.
+
+        Returns:
+            Array (tuple): The merged rows ordered by key.
+
+        Raises:
+            ValueError: if the partitions are out of date with the reviews table.
+    """
+    if not partitions_are_current():
+        raise ValueError("Partitions are out of date with the reviews table, re-create them with create_partitions()")
+    query, key_columns = AGGREGATES[aggregate]
+    years = prune_partitions(start_year, end_year)
+    partition_years = get_partition_years()
+    cold_years = [year for year in years if is_cold_partition(year, partition_years)]
+    results = get_cached_aggregates(aggregate, cold_years)
+    tasks = {year: (lambda partition=get_partition_name(year): cr.run_database_query(query.format(partition)))
+             for year in years if year not in results}
+    results.update(ds.run_dashboard_queries(tasks, max_workers)[0])
+    return merge_aggregates([results[year] for year in years], key_columns)
+
+
+def get_brand_average_ratings(start_year=None, end_year=None):
+    """ Gets the average rating of each brand within a range of years.
+
+        Args:
+            start_year (int, optional): The first year to include.
+            end_year (int, optional): The last year to include.
+
+        Returns:
+            Dictionary (string, float): Key = brand, value = average rating.
+    """
+    return {brand: total / count for brand, total, count in
+            run_partitioned_aggregate("brand_ratings", start_year, end_year)}
+
+
+def get_brand_monthly_average_ratings(start_year=None, end_year=None):
+    """ Gets the average rating per month of each brand within a range of years.
+
+        Args:
+            start_year (int, optional): The first year to include.
+            end_year (int, optional): The last year to include.
+
+        Returns:
+            Array (tuple): brand, date (mm-yy), average rating, ordered by brand then date.
+    """
+    return [(brand, "{0}-{1}".format(date[5:], date[2:4]), total / count) for brand, date, total, count in
+            run_partitioned_aggregate("brand_monthly_ratings", start_year, end_year)]
+
+
+if __name__ == "__main__":
+    """ Executed when the file is run. Creates the year partitions and prints the number of reviews per brand. """
+    create_partitions()
+    for brand, review_count in sorted(run_partitioned_aggregate("brand_review_counts"), key=lambda x: x[1],
+                                      reverse=True):
+        print("\t{0} - {1} reviews".format(brand, review_count))
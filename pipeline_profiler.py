@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import atexit
+import cProfile
+import pstats
+import threading
+import functools
+import contextlib
+import tracemalloc
+
+PROFILE_ENVIRONMENT_VARIABLE = "PHONE_REVIEWS_PROFILE"
+CPROFILE_ENVIRONMENT_VARIABLE = "PHONE_REVIEWS_CPROFILE"
+REPORT_FILE = "profile_report.json"
+TOP_FUNCTIONS = 10
+
+profiler_settings = {"enabled": False, "cprofile_interval": 0, "sampling": False, "wall_start": None,
+                     "cpu_start": None}
+profiler_lock = threading.Lock()
+thread_stages = threading.local()
+
+
+def create_stage_node(name):
+    """ Creates a node of the stage tree.
+
+        Args:
+            name (string): The name of the stage.
+
+        Returns:
+            Dictionary: The stage node.
+    """
+    return {"name": name, "calls": 0, "wall_time": 0.0, "cpu_time": 0.0, "peak_memory": None, "sampled_calls": 0,
+            "stats": None, "children": {}}
+
+
+stage_tree = create_stage_node("pipeline")
+
+
+def enable(cprofile_interval=0):
+    """ Turns on profiling mode. Every stage entered afterwards records its wall time, CPU time and tracemalloc peak.
+
+        Args:
+            cprofile_interval (int, optional): Run every nth call of a hot stage under cProfile, 0 disables cProfile.
+                Defaults to 0.
+    """
+    profiler_settings["enabled"] = True
+    profiler_settings["cprofile_interval"] = cprofile_interval
+    profiler_settings["wall_start"] = time.perf_counter()
+    profiler_settings["cpu_start"] = time.process_time()
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def is_enabled():
+    """ Checks to see if profiling mode is turned on.
+
+        Returns:
+            bool: True if stages are being profiled, otherwise false.
+    """
+    return profiler_settings["enabled"]
+
+
+def get_stage_stack():
+    """ Gets the stack of stages entered on the current thread. Stages entered on a worker thread with nothing on its
+    stack are attached to the root of the tree.
+
+        Returns:
+            Array (Dictionary): The frames of the entered stages, innermost last.
+    """
+    if not hasattr(thread_stages, 'stack'):
+        thread_stages.stack = []
+    return thread_stages.stack
+
+
+def start_sampled_profile(node, hot):
+    """ Starts a cProfile sample of a hot stage if it is due. Only one sample runs at a time across every thread, as
+    cProfile can only be active once per process from Python 3.12.
+
+        Args:
+            node (Dictionary): The node of the stage being entered.
+            hot (bool): True if the stage is a hot loop which may be sampled.
+
+        Returns:
+            `cProfile.Profile`: The running profile, None if the stage isn't being sampled.
+    """
+    interval = profiler_settings["cprofile_interval"]
+    if not hot or interval <= 0:
+        return None
+    with profiler_lock:
+        if profiler_settings["sampling"] or node["calls"] % interval != 0:
+            return None
+        profiler_settings["sampling"] = True
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiling tool outside this module is active
+        with profiler_lock:
+            profiler_settings["sampling"] = False
+        return None
+    return profile
+
+
+@contextlib.contextmanager
+def stage(name, hot=False):
+    """ Measures a stage of the pipeline. Does nothing unless profiling mode is turned on. The tracemalloc peak is one
+    counter for the whole process, so peaks are only measured for stages on the main thread and stages on other
+    threads report none. A main thread peak still includes memory allocated by other threads at the same time.
+
+        Args:
+            name (string): The name of the stage.
+            hot (bool, optional): True if the stage is a hot loop which may be sampled by cProfile.
+    """
+    if not is_enabled():
+        yield
+        return
+    stack = get_stage_stack()
+    with profiler_lock:
+        parent = stack[-1]["node"] if stack else stage_tree
+        node = parent["children"].setdefault(name, create_stage_node(name))
+    track_memory = threading.current_thread() is threading.main_thread()
+    frame = {"node": node, "base_memory": 0, "peak_memory": 0}
+    if track_memory:
+        current_memory, peak_memory = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]["peak_memory"] = max(stack[-1]["peak_memory"], peak_memory)
+        tracemalloc.reset_peak()
+        frame["base_memory"] = frame["peak_memory"] = current_memory
+    stack.append(frame)
+    profile = start_sampled_profile(node, hot)
+    wall_start = time.perf_counter()
+    cpu_start = time.thread_time()
+    try:
+        yield
+    finally:
+        if profile is not None:
+            profile.disable()
+        wall_time = time.perf_counter() - wall_start
+        cpu_time = time.thread_time() - cpu_start
+        stack.pop()
+        stage_peak = None
+        if track_memory:
+            peak_memory = max(frame["peak_memory"], tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1]["peak_memory"] = max(stack[-1]["peak_memory"], peak_memory)
+            stage_peak = peak_memory - frame["base_memory"]
+        with profiler_lock:
+            node["calls"] += 1
+            node["wall_time"] += wall_time
+            node["cpu_time"] += cpu_time
+            if stage_peak is not None:
+                node["peak_memory"] = max(node["peak_memory"] or 0, stage_peak)
+            if profile is not None:
+                profiler_settings["sampling"] = False
+                node["sampled_calls"] += 1
+                if node["stats"] is None:
+                    node["stats"] = pstats.Stats(profile)
+                else:
+                    node["stats"].add(profile)
+
+
+def profiled(stage_name=None, hot=False):
+    """ Decorates a function so every call of it is measured as a stage.
+
+        Args:
+            stage_name (string, optional): The stage the function belongs to, the node is named
+                '<stage_name>: <function name>'. Defaults to the function name alone.
+            hot (bool, optional): True if the function is a hot loop which may be sampled by cProfile.
+
+        Returns:
+            callable: The decorator.
+    """
+    def decorator(function):
+        name = function.__name__ if stage_name is None else "{0}: {1}".format(stage_name, function.__name__)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return function(*args, **kwargs)
+            with stage(name, hot):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_top_functions(stats):
+    """ Gets the functions with the highest cumulative time from sampled cProfile stats.
+
+        Args:
+            stats (`pstats.Stats`): The sampled stats of a stage.
+
+        Returns:
+            Array (Dictionary): The function, number of calls and cumulative seconds of the top functions.
+    """
+    top_functions = sorted(stats.stats.items(), key=lambda x: x[1][3], reverse=True)[:TOP_FUNCTIONS]
+    return [{"function": "{0}:{1}({2})".format(os.path.basename(key[0]), key[1], key[2]), "calls": value[1],
+             "cumulative_time": value[3]} for key, value in top_functions]
+
+
+def get_report(node=None):
+    """ Gets the stage tree as plain data which can be written as JSON.
+
+        Args:
+            node (Dictionary, optional): The node to start from. Defaults to the root of the tree.
+
+        Returns:
+            Dictionary: The measurements of the stage and its children.
+    """
+    node = stage_tree if node is None else node
+    with profiler_lock:
+        children = list(node["children"].values())
+        report = {key: node[key] for key in ["name", "calls", "wall_time", "cpu_time", "peak_memory"]}
+        if node["stats"] is not None:
+            report["sampled_calls"] = node["sampled_calls"]
+            report["top_functions"] = get_top_functions(node["stats"])
+    if node is stage_tree:
+        report["calls"] = 1
+        report["wall_time"] = time.perf_counter() - profiler_settings["wall_start"]
+        report["cpu_time"] = time.process_time() - profiler_settings["cpu_start"]
+        peaks = [child["peak_memory"] for child in children if child["peak_memory"] is not None]
+        report["peak_memory"] = max(peaks) if peaks else None
+    report["children"] = [get_report(child) for child in children]
+    return report
+
+
+def format_report(report, depth=0):
+    """ Formats a stage report as an indented text tree.
+
+        Args:
+            report (Dictionary): The report returned by get_report.
+            depth (int, optional): The depth of the stage within the tree.
+
+        Returns:
+            string: The formatted report.
+    """
+    peak_memory = "n/a" if report["peak_memory"] is None else "{0:.1f} KiB".format(report["peak_memory"] / 1024)
+    lines = ["{0}{1} - {2} calls, {3:.3f}s wall, {4:.3f}s cpu, {5} peak".format(
+        "\t" * depth, report["name"], report["calls"], report["wall_time"], report["cpu_time"], peak_memory)]
+    for function in report.get("top_functions", []):
+        lines.append("{0}  {1} - {2} calls, {3:.3f}s cumulative".format(
+            "\t" * (depth + 1), function["function"], function["calls"], function["cumulative_time"]))
+    for child in sorted(report["children"], key=lambda x: x["wall_time"], reverse=True):
+        lines.append(format_report(child, depth + 1))
+    return "\n".join(lines)
+
+
+def write_report(filename=REPORT_FILE):
+    """ Prints the stage tree and writes it to a JSON file.
+
+        Args:
+            filename (string, optional): The name of the JSON file. Defaults to REPORT_FILE.
+    """
+    report = get_report()
+    print("\nPipeline profile:\n{0}".format(format_report(report)))
+    with open(filename, 'w') as file:
+        json.dump(report, file, indent=4)
+    print("Profile written to '{0}'".format(filename))
+
+
+def get_cprofile_interval():
+    """ Gets the cProfile sampling interval from the environment.
+
+        Returns:
+            int: The interval, 0 if it isn't set or isn't a whole number.
+    """
+    value = os.environ.get(CPROFILE_ENVIRONMENT_VARIABLE, "")
+    try:
+        return max(0, int(value))
+    except ValueError:
+        if value != "":
+            print("Ignoring {0}='{1}', expected a whole number".format(CPROFILE_ENVIRONMENT_VARIABLE, value))
+        return 0
+
+
+if os.environ.get(PROFILE_ENVIRONMENT_VARIABLE, "") not in ("", "0"):
+    enable(get_cprofile_interval())
+    atexit.register(write_report)
@@ -0,0 +1,317 @@
+import sys
+import json
+import time
+import datetime
+import threading
+import collections
+import urllib.parse
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import created_reviews as cr
+import sql_review as sr
+import excel_review as er
+import numpy_review as nr
+
+HOST = "127.0.0.1"
+PORT = 8080
+CACHE_SIZE = 64
+WORKER_THREADS = 4
+
+
+def parse_bool(value):
+    """ Converts a query string value to a bool.
+
+        Args:
+            value (string): The value given in the query string.
+
+        Returns:
+            bool: True for '1', 'true' or 'yes', otherwise false.
+    """
+    return value.lower() in ("1", "true", "yes")
+
+
+REPORTS = {
+    # name: (function computing the report, accepted query string parameters and their converters)
+    "sql_review/products_alphabetically": (
+        sr.get_distinctive_product_titles_with_at_least_one_review_in_2019_ordered_alphabetically, {}),
+    "sql_review/products_by_rating": (sr.get_product_with_one_or_more_reviews_order_by_rating_desc, {}),
+    "excel_review/reviews_per_year": (er.get_review_yearly_data, {}),
+    "excel_review/verified_customers": (er.get_verified_customer_data, {"approximate": parse_bool}),
+    "numpy_review/top_three_brands_total_reviews": (nr.get_top_three_brands_total_reviews, {"cached": parse_bool}),
+    "numpy_review/top_five_brands_average_rating": (nr.get_top_five_brands_average_rating_per_month_2017_2019, {}),
+    "numpy_review/reviews_against_average_rating": (nr.get_reviews_against_average_rating_for_product_titles, {}),
+    "numpy_review/comments_related_to_price": (nr.get_comments_related_to_price, {"approximate": parse_bool})
+}
+
+service_state = {"signature": None, "executor": None, "hits": 0, "misses": 0, "coalesced": 0}
+service_lock = threading.Lock()
+result_cache = collections.OrderedDict()
+pending_reports = {}
+
+
+def to_json_compatible(data):
+    """ Converts report data into values which can be written as JSON.
+
+        Args:
+            data (variable type): The data returned by a report function.
+
+        Returns:
+            variable type: The data with arrays converted to lists and dates to ISO strings.
+    """
+    if isinstance(data, np.ndarray):
+        return to_json_compatible(data.tolist())
+    if isinstance(data, dict):
+        return {str(key): to_json_compatible(value) for key, value in data.items()}
+    if isinstance(data, (list, tuple)):
+        return [to_json_compatible(value) for value in data]
+    if isinstance(data, (datetime.date, datetime.datetime)):
+        return data.isoformat()
+    if isinstance(data, np.generic):
+        return data.item()
+    return data
+
+
+def create_executor():
+    """ Creates the pool of worker threads computing reports. Each worker keeps its own read-only connection open for
+    as long as the pool exists.
+
+        Returns:
+            `ThreadPoolExecutor`: The worker pool.
+    """
+    return ThreadPoolExecutor(max_workers=WORKER_THREADS, thread_name_prefix="report",
+                              initializer=cr.open_thread_connection)
+
+
+def retire_executor(executor):
+    """ Closes the warm connection of every worker of a replaced pool, then shuts the pool down. Each worker runs one
+    closing task, the barrier keeping a worker from taking a second one before every worker has taken its first.
+
+        Args:
+            executor (`ThreadPoolExecutor`): The pool to be retired.
+    """
+    barrier = threading.Barrier(WORKER_THREADS)
+
+    def close_worker_connection():
+        try:
+            barrier.wait(timeout=60)
+        finally:
+            cr.close_thread_connection()
+
+    for _ in range(WORKER_THREADS):
+        executor.submit(close_worker_connection)
+    executor.shutdown(wait=True)
+
+
+def check_for_database_changes():
+    """ Clears the result cache and replaces the worker pool if the database has changed since the last request. A
+    new pool is needed as warm connections would keep reading a database file which has been re-created. """
+    signature = cr.get_database_signature()
+    with service_lock:
+        if service_state["signature"] == signature:
+            return
+        if service_state["signature"] is not None:
+            print("Database changed, clearing {0} cached reports".format(len(result_cache)))
+        result_cache.clear()
+        old_executor = service_state["executor"]
+        service_state["executor"] = create_executor()
+        service_state["signature"] = signature
+    if old_executor is not None:
+        threading.Thread(target=retire_executor, args=(old_executor,), daemon=True).start()
+
+
+def compute_report(name, params):
+    """ Computes a report and converts it to JSON compatible data.
+
+        Args:
+            name (string): The name of the report.
+            params (Dictionary): The converted query string parameters.
+
+        Returns:
+            variable type: The report data.
+    """
+    return to_json_compatible(REPORTS[name][0](**params))
+
+
+def get_report(name, params):
+    """ Gets a report from the cache, computing it if required. Concurrent requests for the same report and parameters
+    wait on a single computation.
+
+        Args:
+            name (string): The name of the report.
+            params (Dictionary): The converted query string parameters.
+
+        Returns:
+            `tuple`(variable type, bool): The report data and True if it was served from the cache.
+    """
+    check_for_database_changes()
+    key = (name, tuple(sorted(params.items())))
+    with service_lock:
+        if key in result_cache:
+            result_cache.move_to_end(key)
+            service_state["hits"] += 1
+            return result_cache[key], True
+        future = pending_reports.get(key)
+        if future is not None:
+            service_state["coalesced"] += 1
+            owner = False
+        else:
+            service_state["misses"] += 1
+            future = Future()
+            pending_reports[key] = future
+            signature = service_state["signature"]
+            executor = service_state["executor"]
+            owner = True
+    if not owner:
+        return future.result(), False
+    try:
+        try:
+            report_future = executor.submit(compute_report, name, params)
+        except RuntimeError:
+            # The pool was retired by a request which saw the database change, compute on this thread instead
+            report_future = None
+        data = compute_report(name, params) if report_future is None else report_future.result()
+    except Exception as error:
+        with service_lock:
+            del pending_reports[key]
+        future.set_exception(error)
+        raise
+    with service_lock:
+        del pending_reports[key]
+        if service_state["signature"] == signature:
+            result_cache[key] = data
+            while len(result_cache) > CACHE_SIZE:
+                result_cache.popitem(last=False)
+    future.set_result(data)
+    return data, False
+
+
+def parse_report_params(name, query_string):
+    """ Converts the query string parameters of a request into the arguments of a report.
+
+        Args:
+            name (string): The name of the report.
+            query_string (string): The query string of the request.
+
+        Returns:
+            Dictionary: The converted parameters.
+
+        Raises:
+            ValueError: if a parameter isn't accepted by the report.
+    """
+    accepted = REPORTS[name][1]
+    params = {}
+    for param, values in urllib.parse.parse_qs(query_string).items():
+        if param not in accepted:
+            raise ValueError("Report '{0}' doesn't accept the parameter '{1}'".format(name, param))
+        params[param] = accepted[param](values[-1])
+    return params
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    """ Handles requests for reports.
+        1. GET /reports lists the available reports.
+        2. GET /reports/<name>?<params> returns a report.
+        3. GET /stats returns the cache statistics.
+    """
+
+    def send_json(self, status, body):
+        """ Sends a JSON response.
+
+            Args:
+                status (int): The HTTP status code.
+                body (variable type): The data to be sent.
+        """
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        """ Routes a GET request to the report list, a report or the cache statistics. """
+        url = urllib.parse.urlsplit(self.path)
+        if url.path == "/reports":
+            self.send_json(200, sorted(REPORTS))
+        elif url.path == "/stats":
+            with service_lock:
+                stats = {key: service_state[key] for key in ["hits", "misses", "coalesced"]}
+                stats["cached_reports"] = len(result_cache)
+            self.send_json(200, stats)
+        elif url.path.startswith("/reports/") and url.path[len("/reports/"):] in REPORTS:
+            name = url.path[len("/reports/"):]
+            try:
+                params = parse_report_params(name, url.query)
+            except ValueError as error:
+                self.send_json(400, {"error": str(error)})
+                return
+            try:
+                data, cached = get_report(name, params)
+            except Exception as error:
+                self.send_json(500, {"error": "{0}: {1}".format(type(error).__name__, error)})
+                return
+            self.send_json(200, {"report": name, "params": params, "cached": cached, "data": data})
+        else:
+            self.send_json(404, {"error": "No report found at '{0}'".format(url.path)})
+
+    def log_message(self, format, *args):
+        """ Silences the default logging of every request so load tests don't flood the console. """
+        pass
+
+
+def run_service(host=HOST, port=PORT):
+    """ Runs the report service until it is interrupted.
+
+        Args:
+            host (string, optional): The address to listen on. Defaults to localhost.
+            port (int, optional): The port to listen on.
+    """
+    server = ThreadingHTTPServer((host, port), ReportRequestHandler)
+    print("Serving reports from '{0}' on http://{1}:{2}/reports".format(cr.DATABASE_NAME, host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Exiting...")
+    finally:
+        server.server_close()
+        if service_state["executor"] is not None:
+            retire_executor(service_state["executor"])
+
+
+def run_load_test(report, total_requests=100, concurrency=10, host=HOST, port=PORT):
+    """ Sends concurrent requests for a report to a running service and prints the throughput and latencies.
+
+        Args:
+            report (string): The name of the report, optionally followed by a query string.
+            total_requests (int, optional): The number of requests to send.
+            concurrency (int, optional): The number of requests sent at once.
+            host (string, optional): The address of the service.
+            port (int, optional): The port of the service.
+    """
+    url = "http://{0}:{1}/reports/{2}".format(host, port, report)
+
+    def send_request(_):
+        start = time.perf_counter()
+        with urllib.request.urlopen(url) as response:
+            response.read()
+        return time.perf_counter() - start
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = sorted(executor.map(send_request, range(total_requests)))
+    total_time = time.perf_counter() - start_time
+    print("Sent {0} requests for '{1}' in {2:.3f}s ({3:.1f} requests/s)".format(
+        total_requests, report, total_time, total_requests / total_time))
+    print("\tLatency - median {0:.4f}s, 95th percentile {1:.4f}s, max {2:.4f}s".format(
+        latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.95) - 1], latencies[-1]))
+
+
+if __name__ == "__main__":
+    """ Executed when the file is run. Runs the service, or load tests a running service when given
+    'load-test <report>'. """
+    if len(sys.argv) > 2 and sys.argv[1] == "load-test":
+        run_load_test(sys.argv[2])
+    else:
+        run_service()
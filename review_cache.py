@@ -0,0 +1,318 @@
+import os
+import json
+import time
+import shutil
+import datetime
+import contextlib
+import numpy as np
+import created_reviews as cr
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl, msvcrt provides the equivalent lock
+    fcntl = None
+    import msvcrt
+
+CACHE_DIRECTORY = "review_cache"
+MANIFEST_FILE = "manifest.json"
+LOCK_FILE = "export.lock"
+EXPORT_PREFIX = "export-"
+COLUMNS = {"rating": np.int8, "month_key": np.int32, "verified": np.bool_, "item_index": np.int32,
+           "brand_code": np.int16}
+LOOKUPS = ["asins", "brands", "item_brand_codes"]
+
+
+def get_cache_path(name):
+    """ Gets the path of a file within the cache directory.
+
+        Args:
+            name (string): The name of the file.
+
+        Returns:
+            string: The path of the file.
+    """
+    return os.path.join(CACHE_DIRECTORY, name)
+
+
+def get_array_path(export, name):
+    """ Gets the path of an array within an export.
+
+        Args:
+            export (string): The name of the export directory.
+            name (string): The name of the array.
+
+        Returns:
+            string: The path of the `.npy` file.
+    """
+    return os.path.join(CACHE_DIRECTORY, export, "{0}.npy".format(name))
+
+
+def save_array(export, name, array):
+    """ Saves an array into an export directory.
+
+        Args:
+            export (string): The name of the export directory.
+            name (string): The name of the array.
+            array (`ndarray`): The array to be saved.
+    """
+    np.save(get_array_path(export, name), array, allow_pickle=False)
+
+
+def remove_old_exports(current_export):
+    """ Removes every export directory except the current one. Processes still mapping an old export keep reading it,
+    as an open file outlives its directory entry. Directories which can't be removed yet, e.g. because a file is still
+    mapped on Windows, are left for the next export to remove.
+
+        Args:
+            current_export (string): The name of the export the manifest points to.
+    """
+    for name in os.listdir(CACHE_DIRECTORY):
+        if name.startswith(EXPORT_PREFIX) and name != current_export:
+            shutil.rmtree(get_cache_path(name), ignore_errors=True)
+
+
+def write_manifest(manifest):
+    """ Writes the cache manifest, replacing the previous version atomically so that other processes never read a
+    partially written manifest.
+
+        Args:
+            manifest (Dictionary): The manifest contents.
+    """
+    temporary_path = get_cache_path("{0}.{1}.tmp".format(MANIFEST_FILE, os.getpid()))
+    with open(temporary_path, 'w') as file:
+        json.dump(manifest, file)
+    os.replace(temporary_path, get_cache_path(MANIFEST_FILE))
+
+
+@contextlib.contextmanager
+def export_lock():
+    """ Holds an exclusive lock on the cache directory so only one process exports at a time. The lock is released by
+    the operating system if the process holding it dies. """
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    with open(get_cache_path(LOCK_FILE), 'a+') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            locked = False
+            while not locked:
+                try:
+                    lock_file.seek(0)
+                    msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                    locked = True
+                except OSError:
+                    pass
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_manifest():
+    """ Reads the cache manifest.
+
+        Returns:
+            Dictionary: The manifest contents, empty if the cache hasn't been exported.
+    """
+    try:
+        with open(get_cache_path(MANIFEST_FILE)) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def cache_is_valid():
+    """ Checks to see if the cache was exported from the current version of the database.
+
+        Returns:
+            bool: True if the cache is up to date, otherwise false.
+    """
+    manifest = read_manifest()
+    return "export" in manifest and manifest.get("signature") == list(cr.get_database_signature())
+
+
+def export_review_columns():
+    """ Exports the review columns while holding the export lock, so overlapping exports can't mix the arrays of one
+    export with the manifest of another. """
+    with export_lock():
+        write_review_columns()
+
+
+def write_review_columns():
+    """ Writes the numeric and categorical review columns from the database into `.npy` files. The caller must hold
+    the export lock. Every export is written to a new directory which the manifest is switched to once it is complete,
+    so the files of an export never change after it has been published.
+        1. Items are ordered by asin, the item index of a review is the position of its asin.
+        2. Brands are ordered alphabetically, the brand code of a review is the position of its brand.
+        3. The month key of a review is year * 12 + (month - 1).
+    """
+    print("Exporting review columns into '{0}'...".format(CACHE_DIRECTORY))
+    export = "{0}{1}-{2}".format(EXPORT_PREFIX, time.time_ns(), os.getpid())
+    os.makedirs(get_cache_path(export))
+    signature = list(cr.get_database_signature())
+    items = cr.run_database_query("select asin, brand from items order by asin")
+    asins = np.array([item[0] for item in items], dtype=str)
+    brands = np.array(sorted({item[1] for item in items}), dtype=str)
+    brand_lookup = {brand: code for code, brand in enumerate(brands)}
+    item_brand_codes = np.array([brand_lookup[item[1]] for item in items], dtype=COLUMNS["brand_code"])
+    item_lookup = {asin: index for index, asin in enumerate(asins)}
+    reviews = cr.run_database_query("""
+        select r.rating, cast(strftime('%Y', r.review_date) as integer) * 12
+        + cast(strftime('%m', r.review_date) as integer) - 1, r.verified = 'True', r.asin
+        from reviews r join items i on i.asin = r.asin order by r.review_id
+    """)
+    columns = {
+        "rating": np.fromiter((review[0] for review in reviews), COLUMNS["rating"], len(reviews)),
+        "month_key": np.fromiter((review[1] for review in reviews), COLUMNS["month_key"], len(reviews)),
+        "verified": np.fromiter((review[2] for review in reviews), COLUMNS["verified"], len(reviews)),
+        "item_index": np.fromiter((item_lookup[review[3]] for review in reviews), COLUMNS["item_index"], len(reviews))
+    }
+    columns["brand_code"] = item_brand_codes[columns["item_index"]]
+    for name, array in columns.items():
+        save_array(export, name, array)
+    save_array(export, "asins", asins)
+    save_array(export, "brands", brands)
+    save_array(export, "item_brand_codes", item_brand_codes)
+    write_manifest({"signature": signature, "reviews": len(reviews), "export": export})
+    remove_old_exports(export)
+
+
+def load_review_columns():
+    """ Opens the cached review columns as read-only memory maps, re-exporting them first if the database has changed
+    since they were last exported. The cache is checked again once the export lock is held, so processes which were
+    waiting on another process's export use its result instead of exporting again. Every array is opened from the
+    export named by one read of the manifest, so they always come from the same export. Memory maps share the same
+    pages between every process that opens them.
+
+        Returns:
+            Dictionary (`str`, `ndarray`): Key = column or lookup name, value = memory mapped array.
+    """
+    while True:
+        if not cache_is_valid():
+            with export_lock():
+                if not cache_is_valid():
+                    write_review_columns()
+        export = read_manifest().get("export")
+        if export is None:
+            continue
+        try:
+            return {name: np.load(get_array_path(export, name), mmap_mode='r') for name in list(COLUMNS) + LOOKUPS}
+        except FileNotFoundError:
+            # A newer export removed this one before all of its arrays were opened, open the newer export instead
+            continue
+
+
+def month_key_to_date(month_key):
+    """ Converts a month key back into a date.
+
+        Args:
+            month_key (int): The month key, year * 12 + (month - 1).
+
+        Returns:
+            `datetime`: The first day of the month.
+    """
+    return datetime.datetime(int(month_key) // 12, int(month_key) % 12 + 1, 1)
+
+
+def get_brand_mask(columns, brand=None):
+    """ Gets a boolean mask selecting the reviews of a brand.
+
+        Args:
+            columns (Dictionary): The loaded review columns.
+            brand (string, optional): The brand name, None selects every review.
+
+        Returns:
+            `ndarray`: The mask.
+    """
+    if brand is None:
+        return np.ones(len(columns["brand_code"]), dtype=bool)
+    codes = np.flatnonzero(columns["brands"] == brand)
+    if len(codes) == 0:
+        return np.zeros(len(columns["brand_code"]), dtype=bool)
+    return columns["brand_code"] == codes[0]
+
+
+def get_brand_average_ratings(columns):
+    """ Gets the average rating of each brand.
+
+        Args:
+            columns (Dictionary): The loaded review columns.
+
+        Returns:
+            Dictionary (`str`, float): Key = brand name, value = average rating.
+    """
+    brand_count = len(columns["brands"])
+    counts = np.bincount(columns["brand_code"], minlength=brand_count)
+    totals = np.bincount(columns["brand_code"], weights=columns["rating"], minlength=brand_count)
+    reviewed = np.flatnonzero(counts)
+    return dict(zip(columns["brands"][reviewed].tolist(), (totals[reviewed] / counts[reviewed]).tolist()))
+
+
+def get_monthly_review_counts(columns, brand=None):
+    """ Gets the number of reviews left per month.
+
+        Args:
+            columns (Dictionary): The loaded review columns.
+            brand (string, optional): Only count the reviews of this brand.
+
+        Returns:
+            `ndarray`: [[dates][review_counts]]
+    """
+    month_keys, counts = np.unique(columns["month_key"][get_brand_mask(columns, brand)], return_counts=True)
+    return np.array([[month_key_to_date(key) for key in month_keys], counts.tolist()], dtype='object')
+
+
+def get_monthly_average_ratings(columns, brand=None, start_year=None, end_year=None):
+    """ Gets the average rating per month.
+
+        Args:
+            columns (Dictionary): The loaded review columns.
+            brand (string, optional): Only average the reviews of this brand.
+            start_year (int, optional): The first year to include.
+            end_year (int, optional): The last year to include.
+
+        Returns:
+            `ndarray`: [[dates][avg_rating]]
+    """
+    month_key = columns["month_key"]
+    mask = get_brand_mask(columns, brand)
+    if start_year is not None:
+        mask &= month_key >= start_year * 12
+    if end_year is not None:
+        mask &= month_key < (end_year + 1) * 12
+    month_keys, inverse = np.unique(month_key[mask], return_inverse=True)
+    averages = np.bincount(inverse, weights=columns["rating"][mask]) / np.bincount(inverse)
+    return np.array([[month_key_to_date(key) for key in month_keys], averages.tolist()], dtype='object')
+
+
+def get_top_n_brands(columns, n=3, by_rating=False):
+    """ Gets the top n brands by number of reviews or by average rating.
+
+        Args:
+            columns (Dictionary): The loaded review columns.
+            n (int, optional): The number of brands. Defaults to 3.
+            by_rating (bool, optional): True ranks brands by average rating, otherwise by number of reviews.
+
+        Returns:
+            Array (`str`): The brand names, best first.
+    """
+    brand_count = len(columns["brands"])
+    counts = np.bincount(columns["brand_code"], minlength=brand_count)
+    if by_rating:
+        totals = np.bincount(columns["brand_code"], weights=columns["rating"], minlength=brand_count)
+        scores = np.divide(totals, counts, out=np.full(brand_count, -1.0), where=counts > 0)
+    else:
+        scores = counts
+    ranked = np.argsort(-scores, kind='stable')[:n]
+    return [str(columns["brands"][code]) for code in ranked if counts[code] > 0]
+
+
+if __name__ == "__main__":
+    """ Executed when the file is run. Exports the cache if required and prints a summary of the cached columns. """
+    review_columns = load_review_columns()
+    average_ratings = get_brand_average_ratings(review_columns)
+    print("Cache '{0}' contains {1} reviews".format(CACHE_DIRECTORY, len(review_columns["rating"])))
+    for brand_name in get_top_n_brands(review_columns):
+        print("\t{0} - {1:.2f} average rating".format(brand_name, average_ratings[brand_name]))
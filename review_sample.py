@@ -0,0 +1,291 @@
+import re
+import math
+import random
+import created_reviews as cr
+
+SAMPLE_TABLE = "review_sample"
+STRATA_TABLE = "review_strata"
+SAMPLE_SIZE_PER_STRATUM = 1000
+Z_SCORE = 1.96
+loaded_sample = {"signature": None, "strata": {}}
+
+
+def build_review_sample(sample_size=SAMPLE_SIZE_PER_STRATUM, seed=None):
+    """ Builds a stratified reservoir sample of the reviews, keeping up to sample_size reviews for every brand and year.
+    Reviews are streamed from the database so memory only grows with the number of strata.
+
+        Args:
+            sample_size (int, optional): The maximum number of reviews kept per stratum.
+            seed (int, optional): Seeds the random number generator so the sample can be reproduced.
+    """
+    print("Building review sample of up to {0} reviews per brand and year...".format(sample_size))
+    generator = random.Random(seed)
+    reservoirs = {}
+    populations = {}
+    connection = cr.connect_to_database(read_only=True)
+    reviews = connection.execute("""
+        select i.brand, cast(strftime('%Y', r.review_date) as integer), r.review_id, r.rating, r.verified, r.body
+        from reviews r join items i on i.asin = r.asin
+    """)
+    for review in reviews:
+        stratum = review[:2]
+        seen = populations.get(stratum, 0) + 1
+        populations[stratum] = seen
+        reservoir = reservoirs.setdefault(stratum, [])
+        if seen <= sample_size:
+            reservoir.append(review)
+        else:
+            index = generator.randrange(seen)
+            if index < sample_size:
+                reservoir[index] = review
+    connection.close()
+    cr.run_database_query("drop table if exists {0}".format(SAMPLE_TABLE))
+    cr.run_database_query("drop table if exists {0}".format(STRATA_TABLE))
+    cr.run_database_query("""
+        create table {0}(
+            brand varchar(30) not null,
+            year integer not null,
+            population integer not null,
+            sample_size integer not null,
+            constraint {0}_pk primary key (brand, year)
+        );""".format(STRATA_TABLE))
+    cr.run_database_query("""
+        create table {0}(
+            brand varchar(30) not null,
+            year integer not null,
+            review_id integer not null,
+            rating integer(1) not null,
+            verified boolean default False,
+            body text not null,
+            constraint {0}_pk primary key (review_id)
+        );""".format(SAMPLE_TABLE))
+    cr.run_database_query("insert into {0} values(?, ?, ?, ?)".format(STRATA_TABLE),
+                          [stratum + (populations[stratum], len(reservoirs[stratum])) for stratum in populations], False)
+    cr.run_database_query("insert into {0} values(?, ?, ?, ?, ?, ?)".format(SAMPLE_TABLE),
+                          [review for reservoir in reservoirs.values() for review in reservoir], False)
+
+
+def load_review_sample():
+    """ Loads the review sample into memory, reloading it only when the database has changed.
+
+        Returns:
+            Dictionary (`tuple`, Dictionary): Key = (brand, year), value = the population and sampled reviews.
+
+        Raises:
+            ValueError: if the database was seeded without building a review sample.
+    """
+    signature = cr.get_database_signature()
+    if loaded_sample["signature"] != signature:
+        tables = [table[0] for table in cr.get_database_info()]
+        if STRATA_TABLE not in tables or SAMPLE_TABLE not in tables:
+            raise ValueError("No review sample found in '{0}', re-seed the database or run review_sample.py to build "
+                             "one".format(cr.DATABASE_NAME))
+        strata = {}
+        for brand, year, population, sample_size in cr.run_database_query(
+                "select brand, year, population, sample_size from {0}".format(STRATA_TABLE)):
+            strata[(brand, year)] = {"population": population, "reviews": []}
+        for brand, year, rating, verified, body in cr.run_database_query(
+                "select brand, year, rating, verified, body from {0}".format(SAMPLE_TABLE)):
+            strata[(brand, year)]["reviews"].append({"brand": brand, "year": year, "rating": rating,
+                                                     "verified": verified == 'True', "body": body})
+        loaded_sample["strata"] = strata
+        loaded_sample["signature"] = signature
+    return loaded_sample["strata"]
+
+
+def select_strata(brand=None, start_year=None, end_year=None):
+    """ Selects the strata of a brand and range of years.
+
+        Args:
+            brand (string, optional): The brand name, None selects every brand.
+            start_year (int, optional): The first year to include.
+            end_year (int, optional): The last year to include.
+
+        Returns:
+            Array (Dictionary): The selected strata.
+    """
+    return [stratum for (stratum_brand, year), stratum in load_review_sample().items()
+            if (brand is None or stratum_brand == brand) and (start_year is None or year >= start_year)
+            and (end_year is None or year <= end_year)]
+
+
+def get_stratum_variance(values):
+    """ Gets the sample variance of the values of a stratum.
+
+        Args:
+            values (Array (float)): The values of each sampled review.
+
+        Returns:
+            float: The sample variance, 0 if fewer than two reviews were sampled.
+    """
+    if len(values) < 2:
+        return 0.0
+    mean = sum(values) / len(values)
+    return sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+
+
+def get_estimate_variance(strata, values):
+    """ Gets the variance of an estimated total from the per-stratum values, using the finite population correction
+    so that fully sampled strata contribute no error.
+
+        Args:
+            strata (Array (Dictionary)): The strata the values were taken from.
+            values (Array (Array (float))): The values of each sampled review, per stratum.
+
+        Returns:
+            float: The variance of the estimated total.
+    """
+    variance = 0.0
+    for stratum, stratum_values in zip(strata, values):
+        population = stratum["population"]
+        sample_size = len(stratum_values)
+        if sample_size > 0:
+            variance += population ** 2 * (1 - sample_size / population) * get_stratum_variance(stratum_values) \
+                / sample_size
+    return variance
+
+
+def estimate_total(strata, numerator):
+    """ Estimates the number of reviews, or the sum of a value over the reviews, in the selected strata.
+
+        Args:
+            strata (Array (Dictionary)): The selected strata.
+            numerator (callable): Gets the value of a sampled review, 1 or 0 to count the reviews matching a condition.
+
+        Returns:
+            `tuple`(float, float, float): The estimate and the lower and upper bounds of its confidence interval.
+    """
+    values = [[numerator(review) for review in stratum["reviews"]] for stratum in strata]
+    total = sum(stratum["population"] * sum(stratum_values) / len(stratum_values)
+                for stratum, stratum_values in zip(strata, values) if stratum_values)
+    margin = Z_SCORE * math.sqrt(get_estimate_variance(strata, values))
+    return total, max(0.0, total - margin), total + margin
+
+
+def estimate_ratio(strata, numerator, denominator=lambda review: 1, maximum=None):
+    """ Estimates the ratio of two totals over the selected strata, e.g. an average or a percentage. The confidence
+    interval uses the linearised variance of the ratio estimator, clamped to the range the ratio can take.
+
+        Args:
+            strata (Array (Dictionary)): The selected strata.
+            numerator (callable): Gets the numerator value of a sampled review.
+            denominator (callable, optional): Gets the denominator value of a sampled review. Defaults to 1, which
+                estimates the average of the numerator.
+            maximum (float, optional): The largest value the ratio can take, e.g. 100 for a percentage. Defaults to no
+                upper limit.
+
+        Returns:
+            `tuple`(float, float, float): The estimate and the lower and upper bounds of its confidence interval, None
+                if the denominator is estimated to be 0.
+    """
+    numerator_total = estimate_total(strata, numerator)[0]
+    denominator_total = estimate_total(strata, denominator)[0]
+    if denominator_total == 0:
+        return None
+    ratio = numerator_total / denominator_total
+    residuals = [[numerator(review) - ratio * denominator(review) for review in stratum["reviews"]] for stratum in strata]
+    margin = Z_SCORE * math.sqrt(get_estimate_variance(strata, residuals)) / denominator_total
+    upper_bound = ratio + margin if maximum is None else min(maximum, ratio + margin)
+    return ratio, max(0.0, ratio - margin), upper_bound
+
+
+def get_approximate_review_count(brand=None, start_year=None, end_year=None, condition=None):
+    """ Estimates the number of reviews matching a condition.
+
+        Args:
+            brand (string, optional): Only count the reviews of this brand.
+            start_year (int, optional): The first year to include.
+            end_year (int, optional): The last year to include.
+            condition (callable, optional): True if a sampled review should be counted. Defaults to every review.
+
+        Returns:
+            `tuple`(float, float, float): The estimate and the lower and upper bounds of its confidence interval.
+    """
+    return estimate_total(select_strata(brand, start_year, end_year),
+                          lambda review: 1 if condition is None or condition(review) else 0)
+
+
+def get_approximate_average_rating(brand=None, start_year=None, end_year=None):
+    """ Estimates the average rating of reviews.
+
+        Args:
+            brand (string, optional): Only average the reviews of this brand.
+            start_year (int, optional): The first year to include.
+            end_year (int, optional): The last year to include.
+
+        Returns:
+            `tuple`(float, float, float): The estimate and the lower and upper bounds of its confidence interval.
+    """
+    return estimate_ratio(select_strata(brand, start_year, end_year), lambda review: review["rating"], maximum=5)
+
+
+def get_approximate_keyword_rate(pattern, brand=None, start_year=None, end_year=None):
+    """ Estimates the percentage of reviews whose body matches a regular expression.
+
+        Args:
+            pattern (string): The regular expression searched for in each review body.
+            brand (string, optional): Only search the reviews of this brand.
+            start_year (int, optional): The first year to include.
+            end_year (int, optional): The last year to include.
+
+        Returns:
+            `tuple`(float, float, float): The estimate and the lower and upper bounds of its confidence interval.
+    """
+    keyword = re.compile(pattern)
+    return estimate_ratio(select_strata(brand, start_year, end_year),
+                          lambda review: 100 if keyword.search(review["body"]) else 0, maximum=100)
+
+
+def get_approximate_keyword_counts_per_year(pattern):
+    """ Estimates the number of reviews per year whose body matches a regular expression.
+
+        Args:
+            pattern (string): The regular expression searched for in each review body.
+
+        Returns:
+            Dictionary (int, `tuple`): Key = year, value = the estimate and its confidence interval.
+    """
+    keyword = re.compile(pattern)
+    years = sorted({year for brand, year in load_review_sample()})
+    return {year: get_approximate_review_count(start_year=year, end_year=year,
+                                               condition=lambda review: keyword.search(review["body"]) is not None)
+            for year in years}
+
+
+def get_approximate_verified_customer_data():
+    """ Estimates, for each brand, the percentage of all verified reviews left for the brand and the percentage of the
+    brand's reviews which are verified.
+
+        Returns:
+            Array (`tuple`): brand, (% of verified reviews, low, high), (% of brand reviews verified, low, high).
+    """
+    strata = select_strata()
+    brands = sorted({brand for brand, year in load_review_sample()})
+    verified_data = []
+    for brand in brands:
+        share_of_verified = estimate_ratio(strata, lambda review: 100 if review["verified"] and review["brand"] == brand
+                                           else 0, lambda review: 1 if review["verified"] else 0, maximum=100)
+        brand_verified = estimate_ratio(select_strata(brand), lambda review: 100 if review["verified"] else 0,
+                                        maximum=100)
+        if share_of_verified is not None and share_of_verified[0] > 0:
+            verified_data.append((brand, share_of_verified, brand_verified))
+    return sorted(verified_data, key=lambda x: x[1][0])
+
+
+def format_estimate(estimate):
+    """ Formats an estimate with its confidence interval.
+
+        Args:
+            estimate (`tuple`(float, float, float)): The estimate and its confidence interval.
+
+        Returns:
+            string: The formatted estimate.
+    """
+    return "{0:.2f} (95% CI {1:.2f} - {2:.2f})".format(*estimate)
+
+
+if __name__ == "__main__":
+    """ Executed when the file is run. Rebuilds the review sample and prints some approximate statistics. """
+    build_review_sample()
+    print("Approximate number of reviews: {0}".format(format_estimate(get_approximate_review_count())))
+    print("Approximate average rating: {0}".format(format_estimate(get_approximate_average_rating())))
@@ -1,4 +1,5 @@
 import created_reviews as cr
+import pipeline_profiler as prof
 
 TABLE_NAME = "review_summary"
 OUTPUT_FILE = "sql_review_output.txt"
@@ -20,6 +21,7 @@ def create_review_summary_table():
     """)
 
 
+@prof.profiled("report query")
 def get_distinctive_product_titles_with_at_least_one_review_in_2019_ordered_alphabetically():
     """ Retrieves distinct product titles with at least one review and prints the in alphabetical order.
 
@@ -35,6 +37,7 @@ def get_distinctive_product_titles_with_at_least_one_review_in_2019_ordered_alph
     return product_titles
 
 
+@prof.profiled("inserts")
 def insert_information_into_review_summary_table(product_information):
     """ Inserts the data retrieved from a query into the review_summary table.
 
@@ -45,6 +48,7 @@ def insert_information_into_review_summary_table(product_information):
     cr.run_database_query("insert into review_summary values(?, ?, ?, ?)", product_information, False)
 
 
+@prof.profiled("report query")
 def get_product_with_one_or_more_reviews_order_by_rating_desc():
     """ Gets the products with one or more reviews in 2019 ordered by rating descending.
 